@@ -0,0 +1,61 @@
+"""Numba-compiled SplitMix64 kernels; imported lazily by _rng_nb when numba is installed."""
+import numpy as np
+from numba import njit
+
+from ._rng_nb import GOLDEN, MIX1, MIX2, TO_F64
+
+# uint64 constants keep the arithmetic in uint64 (mixing in Python ints would
+# promote to float64)
+_G = np.uint64(GOLDEN)
+_M1 = np.uint64(MIX1)
+_M2 = np.uint64(MIX2)
+_S11 = np.uint64(11)
+_S27 = np.uint64(27)
+_S30 = np.uint64(30)
+_S31 = np.uint64(31)
+
+
+@njit(cache=True)
+def splitmix64(state):
+    """Advance a SplitMix64 state; return ``(new_state, output)``."""
+    state = np.uint64(state) + _G
+    z = state
+    z = (z ^ (z >> _S30)) * _M1
+    z = (z ^ (z >> _S27)) * _M2
+    return state, z ^ (z >> _S31)
+
+
+@njit(cache=True)
+def random_f64(state):
+    """Advance ``state`` and return ``(new_state, float in [0, 1))``."""
+    state, z = splitmix64(state)
+    return state, (z >> _S11) * TO_F64
+
+
+@njit(cache=True)
+def fill_block(state, out):
+    """Write the next ``len(out)`` draws of the stream at ``state`` into ``out``."""
+    s = np.uint64(state)
+    for k in range(out.shape[0]):
+        s, r = random_f64(s)
+        out[k] = r
+
+
+@njit(cache=True)
+def fill_random(states, idx, out):
+    """Write one draw from stream ``states[idx[k]]`` into ``out[k]`` for each k."""
+    for k in range(idx.shape[0]):
+        i = idx[k]
+        s, r = random_f64(states[i])
+        states[i] = s
+        out[k] = r
+
+
+@njit(cache=True)
+def step_counters(states, idx, counters):
+    """Add one draw from stream ``states[idx[k]]`` to ``counters[k]`` for each k."""
+    for k in range(idx.shape[0]):
+        i = idx[k]
+        s, r = random_f64(states[i])
+        states[i] = s
+        counters[k] += r
@@ -0,0 +1,135 @@
+"""SplitMix64 kernels backing the per-entity RNG streams.
+
+Stream states are plain 64-bit integers stored in a contiguous ``np.uint64``
+array owned by the RNG manager. The kernels below advance those states in
+place. They are compiled with Numba (see _rng_jit) when it is installed and
+fall back to equivalent vectorized numpy code otherwise; both produce
+bit-identical sequences. Numba is imported on the first kernel call rather
+than with the package, since loading it costs far more than importing
+everything else.
+"""
+import importlib.util
+
+import numpy as np
+
+GOLDEN = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+MASK64 = (1 << 64) - 1
+TO_F64 = 2.0 ** -53
+
+# whether the compiled kernels will be used; settled for good on first use
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+_G = np.uint64(GOLDEN)
+_M1 = np.uint64(MIX1)
+_M2 = np.uint64(MIX2)
+_S11 = np.uint64(11)
+_S27 = np.uint64(27)
+_S30 = np.uint64(30)
+_S31 = np.uint64(31)
+
+
+def _splitmix64_py(state):
+    state = (int(state) + GOLDEN) & MASK64
+    z = state
+    z = ((z ^ (z >> 30)) * MIX1) & MASK64
+    z = ((z ^ (z >> 27)) * MIX2) & MASK64
+    return state, z ^ (z >> 31)
+
+
+def _random_f64_py(state):
+    state, z = _splitmix64_py(state)
+    return state, (z >> 11) * TO_F64
+
+
+def _mix_f64(s, out):
+    # SplitMix64 output for already advanced states `s`, as floats in [0, 1)
+    z = s ^ (s >> _S30)
+    z *= _M1
+    z ^= z >> _S27
+    z *= _M2
+    z ^= z >> _S31
+    z >>= _S11
+    np.multiply(z, TO_F64, out=out)
+
+
+_GAMMA_STEPS = {}
+
+
+def _fill_block_py(state, out):
+    # SplitMix64 is counter-based: draw k of a block starting at `state` mixes
+    # state + (k+1)*GOLDEN, so the whole block is one vectorized numpy pass
+    n = out.shape[0]
+    steps = _GAMMA_STEPS.get(n)
+    if steps is None:
+        steps = _GAMMA_STEPS[n] = np.arange(1, n + 1, dtype=np.uint64) * _G
+    _mix_f64(steps + np.uint64(state), out)
+
+
+def _advance_py(states, idx):
+    # advance states[idx[k]] once per k, in k order; return the state each k drew
+    n = idx.shape[0]
+    base = states[idx]
+    order = np.argsort(idx, kind='stable')
+    sidx = idx[order]
+    first = np.empty(n, dtype=np.bool_)
+    first[:1] = True
+    np.not_equal(sidx[1:], sidx[:-1], out=first[1:])
+    if first.all():
+        # no stream drawn twice: one step each
+        s = base + _G
+        states[idx] = s
+        return s
+    # the j-th occurrence of a stream draws its j-th value: state + j*GOLDEN
+    starts = np.flatnonzero(first)
+    sizes = np.diff(np.append(starts, n))
+    occurrence = np.empty(n, dtype=np.uint64)
+    occurrence[order] = np.arange(1, n + 1) - np.repeat(starts, sizes)
+    s = base + occurrence * _G
+    last = order[starts + sizes - 1]
+    states[idx[last]] = s[last]
+    return s
+
+
+def _fill_random_py(states, idx, out):
+    if idx.shape[0]:
+        _mix_f64(_advance_py(states, idx), out)
+
+
+def _step_counters_py(states, idx, counters):
+    if idx.shape[0]:
+        r = np.empty(idx.shape[0], dtype=np.float64)
+        _mix_f64(_advance_py(states, idx), r)
+        counters += r
+
+
+def _bind_kernels():
+    """Replace the lazy entry points below with the compiled or numpy kernels."""
+    global HAVE_NUMBA, fill_block, fill_random, step_counters
+    try:
+        from . import _rng_jit
+    except ImportError:  # numba is an optional accelerator
+        HAVE_NUMBA = False
+        fill_block, fill_random, step_counters = _fill_block_py, _fill_random_py, _step_counters_py
+    else:
+        HAVE_NUMBA = True
+        fill_block, fill_random, step_counters = _rng_jit.fill_block, _rng_jit.fill_random, _rng_jit.step_counters
+
+
+def fill_block(state, out):
+    """Write the next ``len(out)`` draws of the stream at ``state`` into ``out``."""
+    _bind_kernels()
+    fill_block(state, out)
+
+
+def fill_random(states, idx, out):
+    """Write one draw from stream ``states[idx[k]]`` into ``out[k]`` for each k."""
+    _bind_kernels()
+    fill_random(states, idx, out)
+
+
+def step_counters(states, idx, counters):
+    """Add one draw from stream ``states[idx[k]]`` to ``counters[k]`` for each k."""
+    _bind_kernels()
+    step_counters(states, idx, counters)
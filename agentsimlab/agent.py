@@ -2,6 +2,8 @@
 from typing import Any, Dict
 
 class BaseAgent:
+    __slots__ = ('agent_id',)
+
     def __init__(self, agent_id: str):
         self.agent_id = agent_id
 
@@ -32,15 +34,87 @@ class BaseAgent:
         self.agent_id = data.get('agent_id', self.agent_id)
 
 class CounterAgent(BaseAgent):
-    """A trivial agent used in tests: increments internal counter by kernel-provided RNG each step."""
+    """A trivial agent used in tests: increments internal counter by kernel-provided RNG each step.
+
+    Once bound to a kernel (on first act, or by Experiment.add_agent) the
+    counter lives in that kernel's dense ``counters`` array at ``_idx``; the
+    ``counter`` property reads and writes through to it.
+    """
+    __slots__ = ('_counter', '_kernel', '_idx')
+
     def __init__(self, agent_id: str):
         super().__init__(agent_id)
-        self.counter = 0.0
+        self._counter = 0.0
+        self._kernel = None
+        self._idx = -1
+
+    @property
+    def counter(self) -> float:
+        if self._kernel is None:
+            return self._counter
+        return float(self._kernel.counters[self._idx])
+
+    @counter.setter
+    def counter(self, value: float):
+        if self._kernel is None:
+            self._counter = value
+        else:
+            self._kernel.counters[self._idx] = value
+
+    def bind_counter(self, kernel):
+        """Move the counter into a slot of `kernel.counters` (no-op if already bound there)."""
+        if self._kernel is kernel:
+            return
+        value = self.counter
+        self.unbind_counter()
+        self._idx = kernel.alloc_counter(value)
+        self._kernel = kernel
+
+    def unbind_counter(self):
+        """Copy the counter back onto the agent and free its kernel slot."""
+        if self._kernel is not None:
+            self._counter = self.counter
+            self._kernel.release_counter(self._idx)
+            self._kernel, self._idx = None, -1
+
+    def __getstate__(self):
+        # copies come back unbound, holding the plain counter value: a kernel
+        # reference would drag the whole kernel along (or share its slot)
+        return self.agent_id, self.counter, getattr(self, '__dict__', None)
+
+    def __setstate__(self, state):
+        self.agent_id, self._counter, extra = state
+        self._kernel, self._idx = None, -1
+        if extra:
+            self.__dict__.update(extra)
 
     def act(self, kernel):
-        rng = kernel.get_rng(self.agent_id)
-        self.counter += rng.random()
-        return self.counter
+        if self._kernel is not kernel:
+            self.bind_counter(kernel)
+        counters = kernel.counters
+        counters[self._idx] += kernel.get_rng(self.agent_id).random()
+        return float(counters[self._idx])
+
+    def batch_act(self, kernel, value: float):
+        """Batched form of act(): `value` is this tick's draw from the agent's stream.
+
+        The kernel groups consecutive entities exposing batch_act and draws all
+        their values in one call. A subclass that overrides act(), step() or
+        step_phase() without also overriding batch_act is stepped individually.
+        """
+        self.counter += value
+
+    @classmethod
+    def fused_step(cls, kernel, states):
+        """Step a homogeneous block (see Kernel.register_homogeneous) in one vectorized pass.
+
+        `states` holds 'ids' (agent ids, one RNG stream each) and a float64
+        'counter' array; resolved stream indices are cached under 'rng_idx'.
+        """
+        idx = states.get('rng_idx')
+        if idx is None:
+            idx = states['rng_idx'] = kernel.stream_indices(states['ids'])
+        states['counter'] += kernel.batch_random_at(idx)
 
     def snapshot(self):
         return {'agent_id': self.agent_id, 'counter': self.counter}
@@ -1,91 +1,371 @@
 """Deterministic Kernel with RNG management and deterministic scheduling.
 
 Features:
-- Master RNG seed for run-level determinism.
-- Per-entity RNG streams derived deterministically from master RNG.
+- Master seed for run-level determinism.
+- Per-entity RNG streams seeded by hashing (master seed, entity name), so a
+  stream never depends on the order in which streams were created.
 - Deterministic scheduler that runs registered entities in a stable order.
 - Snapshot/restore capturing time and RNG states for reproducibility.
 - Support for logical "phases" within a tick to allow deterministic ordering
   of perception/action/commit steps.
 
 Notes:
-- This implementation uses Python's `random.Random` for portability.
-- For higher-performance or cross-language reproducibility, replace RNG
-  implementation with a fixed algorithm like PCG64 and serialize state explicitly.
+- Per-entity streams use SplitMix64 with their 64-bit states held in one
+  contiguous ``np.uint64`` array, so homogeneous populations can be stepped
+  by a single (Numba-compiled when available) batch kernel.
+- The master seed is only a key for stream seeding; there is no separate
+  master generator. Snapshots record it so streams first requested after a
+  restore get the seeds they would have had in the original run.
 """
 from typing import Any, Dict, List, Optional, Callable, Tuple
-import random
-import pickle
 import hashlib
+from array import array
+import operator
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
+
+from . import _rng_nb
+from .agent import BaseAgent, CounterAgent
+from .snapshot import KERNEL_MAGIC, pack_rng_manager, unpack_rng_manager
+
+# scalar draws are served in blocks that double from _MIN_BLOCK up to _MAX_BLOCK
+# values (2KB at most per stream, below the 2.5KB of a Mersenne Twister state)
+_MIN_BLOCK = 8
+_MAX_BLOCK = 256
+_TWO53 = float(1 << 53)
 
 class RNGStream:
-    """A lightweight RNG stream wrapper around random.Random.
+    """A SplitMix64 stream whose 64-bit state lives in a shared uint64 array.
 
-    Each stream is seeded from an integer. We keep its internal state via getstate/setstate.
+    Streams created by RNGManager share the manager's state and dirty-flag
+    arrays; a stream constructed directly owns one-element arrays of its own.
+
+    Single draws are served from a block of precomputed values, so random()
+    is a C-level iterator step rather than a Numba or numpy call per draw.
+    SplitMix64 is counter-based, which keeps the shared state exact: the array
+    slot holds the state at the start of the current block, and sync() commits
+    the draws consumed so far (dropping the rest) before anything else reads
+    or writes the slot.
     """
-    def __init__(self, seed: int):
-        self._seed = int(seed)
-        self._rng = random.Random(self._seed)
+    __slots__ = ('_states', '_dirty', '_idx', '_block', '_it', '_pending',
+                 '_block_size', 'random')
+
+    def __init__(self, seed: int, states: Optional[np.ndarray] = None, index: int = 0,
+                 dirty: Optional[np.ndarray] = None):
+        self._idx = index
+        self._bind(states if states is not None else np.zeros(1, dtype=np.uint64),
+                   dirty if dirty is not None else np.zeros(1, dtype=np.bool_))
+        self._states[index] = int(seed)
+        self._start()
+
+    def _start(self):
+        self._block = array('d')
+        self._it = iter(self._block)
+        self._pending = 0  # draws in the current block not yet committed to the slot
+        self._block_size = _MIN_BLOCK
+        # random() is the chained iterator's own __next__: no Python frame per draw
+        self.random: Callable[[], float] = chain.from_iterable(self._blocks()).__next__
 
-    def random(self) -> float:
-        return self._rng.random()
+    def __getstate__(self):
+        # the block generator cannot be pickled: commit consumed draws and keep the
+        # slot, so copies share the (copied) state array like the original does
+        self.sync()
+        return self._states, self._dirty, self._idx
+
+    def __setstate__(self, state):
+        states, dirty, self._idx = state
+        self._bind(states, dirty)
+        self._start()
+
+    def _bind(self, states: np.ndarray, dirty: np.ndarray):
+        self._states = states
+        self._dirty = dirty
+
+    def _blocks(self):
+        while True:
+            i = self._idx
+            # reaching here means the previous block was consumed entirely
+            state = (int(self._states[i]) + self._pending * _rng_nb.GOLDEN) & _rng_nb.MASK64
+            n = self._block_size
+            self._block_size = min(2 * n, _MAX_BLOCK)
+            out = np.empty(n, dtype=np.float64)
+            _rng_nb.fill_block(np.uint64(state), out)
+            self._states[i] = state
+            self._pending = n
+            self._dirty[i] = True
+            block = self._block
+            del block[:]
+            block.frombytes(memoryview(out).cast('B'))
+            self._it = iter(block)
+            yield self._it
+
+    def sync(self):
+        """Commit consumed draws to the state slot and drop the rest of the block."""
+        if not self._pending:
+            return
+        # draining the iterator counts the unused draws and makes the chain move on
+        # to a fresh block on the next random() call
+        used = self._pending - len(array('d', self._it))
+        i = self._idx
+        self._states[i] = (int(self._states[i]) + used * _rng_nb.GOLDEN) & _rng_nb.MASK64
+        self._pending = 0
+        self._dirty[i] = False
 
     def randint(self, a: int, b: int) -> int:
-        return self._rng.randint(a, b)
+        """Return a uniform integer in [a, b], like random.Random.randint."""
+        if a > b:
+            raise ValueError(f"empty range for randint({a}, {b})")
+        n = b - a + 1
+        k = (n - 1).bit_length()
+        draw = self.random
+        while True:
+            # each draw is exactly its top 53 output bits scaled by 2**-53; join
+            # enough of them for k bits and reject values outside the range
+            r, bits = 0, 0
+            while bits < k:
+                r = (r << 53) | int(draw() * _TWO53)
+                bits += 53
+            r >>= bits - k
+            if r < n:
+                return a + r
 
-    def get_state(self) -> Tuple:
-        return self._rng.getstate()
+    def get_state(self) -> int:
+        self.sync()
+        return int(self._states[self._idx])
 
-    def set_state(self, state: Tuple):
-        self._rng.setstate(state)
+    def set_state(self, state: int):
+        self.sync()
+        self._states[self._idx] = state
 
     def reseed(self, seed: int):
-        self._seed = int(seed)
-        self._rng = random.Random(self._seed)
+        # a SplitMix64 stream seeded with `seed` starts from state `seed`
+        self.set_state(int(seed))
+
+@lru_cache(maxsize=65536)
+def _kdf_seed(master_bytes: bytes, name: str) -> int:
+    """63-bit seed from SHA-256(master_bytes || name), memoized since pooled agent ids recur."""
+    digest = hashlib.sha256(master_bytes + name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') & ((1<<63)-1)
 
 class RNGManager:
-    """Manages the master RNG and per-entity streams.
+    """Manages the master seed and per-entity streams.
 
-    Per-entity seeds are derived deterministically from the master RNG using
-    hashed integers so that per-entity streams are reproducible across runs.
+    Per-entity seeds are a hash of the master seed and the stream name, so
+    per-entity streams are reproducible across runs regardless of the order
+    in which they are first requested.
     """
     def __init__(self, master_seed: int):
-        self.master_seed = int(master_seed)
-        self.master = random.Random(self.master_seed)
+        try:
+            seed = operator.index(master_seed)
+        except TypeError:
+            raise TypeError(f"master seed must be an integer, got {master_seed!r}") from None
+        # any integer seed (e.g. a negative hash()) is reduced into the 64 bits
+        # the stream KDF consumes
+        self._set_master_seed(seed & _rng_nb.MASK64)
+        # Streams materialize in two steps: a reserved name only holds its seed in
+        # _seeds; it gets a slot in the SoA `states` array (one uint64 SplitMix64
+        # state, indexed via _index) when first drawn from, and an RNGStream
+        # handle in _streams only when requested through get_stream().
+        self._seeds: Dict[str, int] = {}
+        self.states = np.zeros(16, dtype=np.uint64)
+        # dirty[i]: the handle on slot i holds a partly consumed block (see RNGStream.sync)
+        self.dirty = np.zeros(16, dtype=np.bool_)
+        self._index: Dict[str, int] = {}
         self._streams: Dict[str, RNGStream] = {}
+        self._slot_streams: Dict[int, RNGStream] = {}
+
+    def _set_master_seed(self, seed: int):
+        self.master_seed = seed
+        self._master_bytes = seed.to_bytes(8, 'big')
 
     def _derive_seed(self, name: str) -> int:
-        # derive a 32-bit-ish integer seed deterministically from master RNG and name
-        # We draw from master RNG deterministically and mix with the name hash.
-        # Note: calling this will advance the master RNG; the order of derive calls is stable
-        # as long as registration order is deterministic.
-        drawn = self.master.getrandbits(64)
-        h = int(hashlib.sha256(name.encode('utf-8')).hexdigest(), 16) & ((1<<64)-1)
-        seed = (drawn ^ h) & ((1<<63)-1)
-        return seed
+        # counter-mode style KDF: the seed is a pure function of (master seed, name)
+        return _kdf_seed(self._master_bytes, name)
+
+    def bulk_derive(self, names: List[str]) -> np.ndarray:
+        """Derive seeds for `names` as a uint64 array; element i equals _derive_seed(names[i])."""
+        mb = self._master_bytes
+        return np.fromiter((_kdf_seed(mb, nm) for nm in names), dtype=np.uint64, count=len(names))
+
+    def reserve(self, name: str):
+        """Record `name`'s seed without allocating any stream state."""
+        if name not in self._index and name not in self._seeds:
+            self._seeds[name] = self._derive_seed(name)
+
+    def reserve_many(self, names: List[str]):
+        """reserve() for several names, deriving their seeds in one bulk pass."""
+        new = [nm for nm in dict.fromkeys(names) if nm not in self._index and nm not in self._seeds]
+        self._seeds.update(zip(new, self.bulk_derive(new).tolist()))
+
+    def _grow(self, extra: int):
+        needed = len(self._index) + extra
+        if needed <= len(self.states):
+            return
+        # double on fill and repoint existing streams at the new array
+        cap = len(self.states)
+        while cap < needed:
+            cap *= 2
+        n = len(self._index)
+        grown = np.zeros(cap, dtype=np.uint64)
+        grown[:n] = self.states[:n]
+        dirty = np.zeros(cap, dtype=np.bool_)
+        dirty[:n] = self.dirty[:n]
+        self.states, self.dirty = grown, dirty
+        for s in self._streams.values():
+            s._bind(grown, dirty)
+
+    def _add_slot(self, name: str, state: int) -> int:
+        self._grow(1)
+        idx = len(self._index)
+        self._index[name] = idx
+        self.states[idx] = state
+        return idx
+
+    def index_of(self, name: str) -> int:
+        """Return the position of `name`'s state in `states`, allocating it if needed."""
+        idx = self._index.get(name)
+        if idx is None:
+            seed = self._seeds.pop(name, None)
+            idx = self._add_slot(name, self._derive_seed(name) if seed is None else seed)
+        return idx
 
     def get_stream(self, name: str) -> RNGStream:
-        if name not in self._streams:
-            seed = self._derive_seed(name)
-            self._streams[name] = RNGStream(seed)
-        return self._streams[name]
-
-    def get_state(self) -> Dict[str, Tuple]:
-        state = {'master_state': self.master.getstate(), 'streams': {}}
-        for name, s in self._streams.items():
-            state['streams'][name] = s.get_state()
-        return state
+        stream = self._streams.get(name)
+        if stream is None:
+            idx = self.index_of(name)
+            stream = RNGStream(self.states[idx], self.states, idx, self.dirty)
+            self._streams[name] = stream
+            self._slot_streams[idx] = stream
+        return stream
 
-    def set_state(self, state: Dict[str, Tuple]):
-        self.master.setstate(state['master_state'])
-        for name, st in state.get('streams', {}).items():
-            if name in self._streams:
-                self._streams[name].set_state(st)
+    def sync(self, idx: Optional[np.ndarray] = None):
+        """Flush buffered scalar draws into `states` for slots `idx` (default: all).
+
+        Must run before any batch kernel or snapshot reads or writes those slots.
+        """
+        if idx is None:
+            slots = np.nonzero(self.dirty[:len(self._index)])[0]
+        else:
+            mask = self.dirty[idx]
+            if not mask.any():
+                return
+            slots = idx[mask]
+        for i in slots.tolist():
+            self._slot_streams[i].sync()
+
+    def get_state(self) -> Dict[str, Any]:
+        self.sync()
+        states = self.states
+        return {
+            'master_seed': self.master_seed,
+            'streams': {name: int(states[idx]) for name, idx in self._index.items()},
+            # cold streams are just their seeds
+            'seeds': dict(self._seeds),
+        }
+
+    def set_state(self, state: Dict[str, Any]):
+        self._set_master_seed(state['master_seed'])
+        self.sync()
+        if 'states' in state:
+            names = state['names']
+            if list(self._index) == names:
+                # same streams in the same order: restore with one array copy
+                self.states[:len(names)] = state['states']
+                streams = ()
+            else:
+                streams = zip(names, state['states'].tolist())
+        else:
+            streams = state.get('streams', {}).items()
+        for name, st in streams:
+            idx = self._index.get(name)
+            if idx is None:
+                self._seeds.pop(name, None)
+                self._add_slot(name, st)
             else:
-                # create stream and set its state
-                s = RNGStream(0)
-                s.set_state(st)
-                self._streams[name] = s
+                self.states[idx] = st
+        for name, seed in state.get('seeds', {}).items():
+            idx = self._index.get(name)
+            if idx is None:
+                self._seeds[name] = seed
+            else:
+                # a stream that was still cold at snapshot time: rewind it to its seed
+                self.states[idx] = seed
+
+def _is_counter_like(entity: Any) -> bool:
+    """True if `entity` behaves exactly like CounterAgent during a tick (no overridden stepping)."""
+    cls = type(entity)
+    return (isinstance(entity, CounterAgent)
+            and cls.act is CounterAgent.act
+            and cls.step is BaseAgent.step
+            and cls.step_phase is BaseAgent.step_phase)
+
+def _can_batch(entity: Any) -> bool:
+    """True if `entity` has a batch_act defined alongside the stepping it stands in for.
+
+    An act, step or step_phase overridden below the class that defines batch_act
+    would be bypassed by batching, so such entities are stepped individually.
+    """
+    if not callable(getattr(entity, 'batch_act', None)):
+        return False
+    cls = type(entity)
+    owner = next((k for k in cls.__mro__ if 'batch_act' in k.__dict__), None)
+    if owner is None:
+        return False
+    return all(getattr(cls, name, None) is getattr(owner, name, None)
+               for name in ('act', 'step', 'step_phase'))
+
+def _step_entry(entity: Any, phase: str) -> Tuple[Callable, str]:
+    step_fn = getattr(entity, 'step_phase', None)
+    if not callable(step_fn):
+        # default: call .step(kernel)
+        step_fn = lambda k, p, e=entity: e.step(k)
+    return step_fn, phase
+
+# longest schedule compile_schedule() unrolls into straight-line calls
+_MAX_UNROLL = 256
+# ticks the registry must stay unchanged before run() compiles the schedule;
+# under churn the generated loop would be thrown away almost every tick
+_COMPILE_AFTER = 8
+
+class _BatchGroup:
+    """A run of batch_act entities stepped with one vectorized RNG draw.
+
+    Registry changes replace a group with an edited copy rather than mutating
+    it, so a phase already iterating the old group is unaffected.
+    """
+    def __init__(self, entities: Optional[List[Any]] = None, idx: Optional[np.ndarray] = None):
+        self.entities: List[Any] = entities if entities is not None else []
+        self.idx = idx
+
+    def extended(self, kernel, entity: Any) -> '_BatchGroup':
+        idx = self.idx
+        if idx is not None:
+            idx = np.append(idx, kernel.stream_indices([entity.agent_id]))
+        return _BatchGroup(self.entities + [entity], idx)
+
+    def without(self, entity: Any) -> '_BatchGroup':
+        j = next(j for j, e in enumerate(self.entities) if e is entity)
+        idx = None if self.idx is None else np.delete(self.idx, j)
+        return _BatchGroup(self.entities[:j] + self.entities[j + 1:], idx)
+
+    def run(self, kernel, phase: str):
+        if self.idx is None:
+            # resolve streams lazily, on the group's first tick
+            self.idx = kernel.stream_indices([e.agent_id for e in self.entities])
+        values = kernel.batch_random_at(self.idx).tolist()
+        for e, v in zip(self.entities, values):
+            e.batch_act(kernel, v)
+
+class _HomogeneousBlock:
+    """An array-backed population of `agent_type`, stepped by one fused_step call per tick."""
+    def __init__(self, agent_type: type, states: Dict[str, Any]):
+        self.agent_type = agent_type
+        self.states = states
+
+    def step_phase(self, kernel, phase: str):
+        self.agent_type.fused_step(kernel, self.states)
 
 class Kernel:
     """Deterministic simulation kernel.
@@ -100,10 +380,60 @@ class Kernel:
     def __init__(self, seed: int = 0, phases: Optional[List[str]] = None):
         self.time = 0
         self._rng_manager = RNGManager(seed)
-        self._entities: List[Tuple[str, Any]] = []  # list of (id, entity)
         self._phases = phases or ['perceive', 'act', 'commit']
-        # mapping phase -> list of (id, entity)
-        self._phase_registrations: Dict[str, List[Tuple[str, Any]]] = {p: [] for p in self._phases}
+        self._phase_ids = {p: i for i, p in enumerate(self._phases)}
+        # SoA entity registry indexed by registration slot; unregistered slots are
+        # tombstoned (entity None, phase -1) and compacted once they are the majority
+        self._ids: List[str] = []
+        self._entities_arr = np.empty(16, dtype=object)
+        self._phase_idx = np.full(16, -1, dtype=np.int32)
+        self._entity_to_idx: Dict[int, int] = {}  # id(entity) -> slot
+        self._n_dead = 0
+        # per-phase lists of (bound step function, phase) in execution order; rebuilt lazily when None.
+        # Registration appends to it and unregistration splices it, both by swapping in
+        # new per-phase lists; _schedule_keys[p][j] is id() of the entity (or
+        # _BatchGroup) behind _schedule[p][j], and _groups maps id(entity) -> its group.
+        self._schedule: Optional[List[List[Tuple[Callable, str]]]] = None
+        self._schedule_keys: List[List[int]] = []
+        self._groups: Dict[int, _BatchGroup] = {}
+        # cached batch plan for all-CounterAgent populations; None = not built yet, False = not eligible
+        self._counter_plan = None
+        # dense per-agent counter storage handed out by alloc_counter(); freed slots are reused
+        self.counters = np.zeros(16, dtype=np.float64)
+        self._n_counters = 0
+        self._free_counters: List[int] = []
+        # run() loop specialised for the current schedule (see compile_schedule)
+        self._compiled_run: Optional[Callable[[Any, int], int]] = None
+        # ticks run() has executed since the registry last changed
+        self._stable_ticks = 0
+
+    def _invalidate(self):
+        """Drop everything derived from the registry; rebuilt on the next step/run."""
+        self._schedule = None
+        self._registry_changed()
+
+    def _registry_changed(self):
+        # the schedule is kept up to date in place; what is derived from it is not
+        self._counter_plan = None
+        self._compiled_run = None
+        self._stable_ticks = 0
+
+    def __getstate__(self):
+        # the schedule holds lambdas and the exec'd run loop, none of which pickle;
+        # it is rebuilt from the registry on the next step
+        state = self.__dict__.copy()
+        state.update(_schedule=None, _schedule_keys=[], _groups={}, _counter_plan=None,
+                     _compiled_run=None)
+        # agents unpickle unbound (see CounterAgent.__getstate__), so a copy
+        # starts with no counter slots handed out
+        state.update(counters=np.zeros(16, dtype=np.float64), _n_counters=0, _free_counters=[])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the registry is keyed by id(), which changes in a copy
+        self._entity_to_idx = {id(e): k for k, e in enumerate(self._entities_arr[:len(self._ids)].tolist())
+                               if e is not None}
 
     def register(self, entity_id: str, entity: Any, phase: Optional[str] = None):
         """Register an entity under a stable id and optional phase.
@@ -114,51 +444,325 @@ class Kernel:
         if phase not in self._phases:
             raise ValueError(f"Unknown phase: {phase}")
         # avoid duplicate registrations
-        if any(entity is e for (_id, e) in self._entities):
+        if id(entity) in self._entity_to_idx:
             return
-        self._entities.append((entity_id, entity))
-        self._phase_registrations[phase].append((entity_id, entity))
+        k = len(self._ids)
+        if k == len(self._entities_arr):
+            self._resize(2 * k)
+        p = self._phase_ids[phase]
+        self._ids.append(entity_id)
+        self._entities_arr[k] = entity
+        self._phase_idx[k] = p
+        self._entity_to_idx[id(entity)] = k
+        if self._schedule is not None:
+            self._schedule_append(p, phase, entity)
+        self._registry_changed()
+
+    def register_many(self, entries):
+        """Register several entities at once.
+
+        `entries` holds (entity_id, entity) or (entity_id, entity, phase) tuples.
+        Unlike register(), this also reserves each entity's RNG stream seed (keyed
+        by entity_id) with a single bulk derivation; stream state is still only
+        allocated on first use.
+        """
+        entries = list(entries)
+        for entry in entries:
+            self.register(*entry)
+        self._rng_manager.reserve_many([entry[0] for entry in entries])
+
+    def register_homogeneous(self, agent_type: type, state_arrays: Dict[str, Any],
+                             block_id: Optional[str] = None, phase: Optional[str] = None) -> Dict[str, Any]:
+        """Register a whole population of `agent_type` held as state arrays rather than objects.
+
+        `agent_type.fused_step(kernel, states)` is called once per tick (in `phase`)
+        in place of per-agent stepping; `state_arrays` is passed through as `states`
+        and is the population's live state. Returns `state_arrays`.
+        """
+        if not callable(getattr(agent_type, 'fused_step', None)):
+            raise TypeError(f"{agent_type.__name__} does not define fused_step(kernel, states)")
+        block = _HomogeneousBlock(agent_type, state_arrays)
+        self.register(block_id or f"{agent_type.__name__}-block-{len(self._ids)}", block, phase=phase)
+        return state_arrays
 
     def unregister(self, entity: Any):
-        self._entities = [(i,e) for (i,e) in self._entities if e is not entity]
-        for p in self._phases:
-            self._phase_registrations[p] = [(i,e) for (i,e) in self._phase_registrations[p] if e is not entity]
+        k = self._entity_to_idx.pop(id(entity), None)
+        if k is None:
+            return
+        p = int(self._phase_idx[k])
+        self._entities_arr[k] = None
+        self._phase_idx[k] = -1
+        self._n_dead += 1
+        if 2 * self._n_dead > len(self._ids):
+            self._compact()
+        if self._schedule is not None:
+            self._schedule_remove(p, entity)
+        self._registry_changed()
+
+    def _resize(self, capacity: int):
+        n = len(self._ids)
+        entities = np.empty(capacity, dtype=object)
+        entities[:n] = self._entities_arr[:n]
+        phase_idx = np.full(capacity, -1, dtype=np.int32)
+        phase_idx[:n] = self._phase_idx[:n]
+        self._entities_arr, self._phase_idx = entities, phase_idx
+
+    def _compact(self):
+        """Drop tombstoned slots, preserving registration order."""
+        n = len(self._ids)
+        live = np.nonzero(self._phase_idx[:n] >= 0)[0]
+        self._ids = [self._ids[k] for k in live.tolist()]
+        m = len(live)
+        self._entities_arr[:m] = self._entities_arr[live]
+        self._entities_arr[m:n] = None
+        self._phase_idx[:m] = self._phase_idx[live]
+        self._phase_idx[m:n] = -1
+        self._entity_to_idx = {id(e): k for k, e in enumerate(self._entities_arr[:m].tolist())}
+        self._n_dead = 0
+
+    def _ordered_entities(self):
+        """Yield (phase, entity) for live entities in phase-then-registration order."""
+        n = len(self._ids)
+        phase_idx = self._phase_idx[:n]
+        for p, phase in enumerate(self._phases):
+            for entity in self._entities_arr[np.nonzero(phase_idx == p)[0]].tolist():
+                yield phase, entity
+
+    def alloc_counter(self, initial: float = 0.0) -> int:
+        """Reserve a slot in `counters`, set it to `initial` and return its index."""
+        if self._free_counters:
+            idx = self._free_counters.pop()
+        else:
+            idx = self._n_counters
+            if idx == len(self.counters):
+                grown = np.zeros(2 * idx, dtype=np.float64)
+                grown[:idx] = self.counters
+                self.counters = grown
+            self._n_counters += 1
+        self.counters[idx] = initial
+        return idx
+
+    def release_counter(self, idx: int):
+        self.counters[idx] = 0.0
+        self._free_counters.append(idx)
+        # the counter plan may hold this slot (e.g. its agent rebound to another kernel)
+        self._counter_plan = None
+
+    def flush_counters(self) -> np.ndarray:
+        """Return a view of all allocated counter slots for batch analytics (freed slots read 0)."""
+        return self.counters[:self._n_counters]
 
     def get_rng(self, name: str):
         """Return the RNGStream for a given name (usually agent id)."""
         return self._rng_manager.get_stream(name)
 
+    def stream_indices(self, names) -> np.ndarray:
+        """Return the state-array positions of the named streams, creating them in order if needed."""
+        return np.array([self._rng_manager.index_of(n) for n in names], dtype=np.int64)
+
+    def batch_random(self, names: List[str]) -> np.ndarray:
+        """Advance each named stream once and return the draws as a float64 array."""
+        return self.batch_random_at(self.stream_indices(names))
+
+    def batch_random_at(self, idx: np.ndarray) -> np.ndarray:
+        """Like batch_random(), for streams already resolved with stream_indices()."""
+        out = np.empty(len(idx), dtype=np.float64)
+        self._rng_manager.sync(idx)
+        _rng_nb.fill_random(self._rng_manager.states, idx, out)
+        return out
+
+    def _build_schedule(self) -> List[List[Tuple[Callable, str]]]:
+        """Resolve each entity's step function once, in phase-then-registration order.
+
+        Returns one list of entries per phase. Consecutive entities in a phase
+        that can be batched (see _can_batch) are collapsed into one entry that
+        draws all their RNG values with a single batch call.
+        """
+        schedule = [[] for _ in self._phases]
+        keys = [[] for _ in self._phases]
+        self._groups = {}
+        group, group_phase = None, None
+        for phase, entity in self._ordered_entities():
+            p = self._phase_ids[phase]
+            if _can_batch(entity):
+                if group is None or group_phase != phase:
+                    group, group_phase = _BatchGroup(), phase
+                    schedule[p].append((group.run, phase))
+                    keys[p].append(id(group))
+                group.entities.append(entity)
+                self._groups[id(entity)] = group
+                continue
+            group = None
+            schedule[p].append(_step_entry(entity, phase))
+            keys[p].append(id(entity))
+        self._schedule_keys = keys
+        return schedule
+
+    def _set_phase_entries(self, p: int, entries: List[Tuple[Callable, str]], keys: List[int]):
+        # new lists rather than in-place edits: a phase that is running keeps
+        # iterating its old entries, as if it had copied its registrations
+        self._schedule[p] = entries
+        self._schedule_keys[p] = keys
+
+    def _replace_group(self, p: int, old: _BatchGroup, new: _BatchGroup, phase: str):
+        entries, keys = list(self._schedule[p]), list(self._schedule_keys[p])
+        j = keys.index(id(old))
+        if new.entities:
+            entries[j], keys[j] = (new.run, phase), id(new)
+            self._groups.update(dict.fromkeys(map(id, new.entities), new))
+        else:
+            del entries[j], keys[j]
+        self._set_phase_entries(p, entries, keys)
+
+    def _schedule_append(self, p: int, phase: str, entity: Any):
+        """Add a just-registered entity (last in its phase) to the built schedule."""
+        entries, keys = self._schedule[p], self._schedule_keys[p]
+        if _can_batch(entity):
+            last = getattr(entries[-1][0], '__self__', None) if entries else None
+            if isinstance(last, _BatchGroup):
+                self._replace_group(p, last, last.extended(self, entity), phase)
+                return
+            group = _BatchGroup([entity])
+            self._groups[id(entity)] = group
+            self._set_phase_entries(p, entries + [(group.run, phase)], keys + [id(group)])
+            return
+        self._set_phase_entries(p, entries + [_step_entry(entity, phase)], keys + [id(entity)])
+
+    def _schedule_remove(self, p: int, entity: Any):
+        """Drop an unregistered entity from phase `p` of the built schedule."""
+        group = self._groups.pop(id(entity), None)
+        if group is not None:
+            self._replace_group(p, group, group.without(entity), self._phases[p])
+            return
+        entries, keys = self._schedule[p], self._schedule_keys[p]
+        j = keys.index(id(entity))
+        self._set_phase_entries(p, entries[:j] + entries[j + 1:], keys[:j] + keys[j + 1:])
+
+    def _build_counter_plan(self):
+        """Return (stream_indices, counter_slots) if every entity steps like a plain CounterAgent, else False."""
+        n = len(self._ids)
+        if n == self._n_dead:
+            return False
+        agents = self._entities_arr[:n][self._phase_idx[:n] >= 0].tolist()
+        # order does not matter for the plan; bail out before any per-agent work
+        if not all(map(_is_counter_like, agents)):
+            return False
+        idx = self.stream_indices([a.agent_id for a in agents])
+        for a in agents:
+            a.bind_counter(self)
+        slots = np.array([a._idx for a in agents], dtype=np.int64)
+        return idx, slots
+
     def step(self):
         """Run a single logical tick executing all phases in order."""
-        # For reproducibility we iterate phases and within each phase iterate in registration order.
-        for phase in self._phases:
-            for entity_id, entity in list(self._phase_registrations[phase]):
-                # call entity.step_phase if available else .step
-                # provide phase to the entity via attribute or method param
-                step_fn = getattr(entity, 'step_phase', None)
-                if callable(step_fn):
-                    step_fn(self, phase)
-                else:
-                    # default: call .step(kernel)
-                    entity.step(self)
+        if self._counter_plan is None:
+            self._counter_plan = self._build_counter_plan()
+        if self._counter_plan:
+            idx, slots = self._counter_plan
+            counters = self.counters[slots]
+            self._rng_manager.sync(idx)
+            _rng_nb.step_counters(self._rng_manager.states, idx, counters)
+            self.counters[slots] = counters
+            self.time += 1
+            return
+        self._run_phases()
         self.time += 1
 
+    def _run_phases(self, first: int = 0):
+        """Run phases `first`.. of the current tick.
+
+        Registry changes made by an entity take effect from the next phase on,
+        as if each phase iterated a copy of its registrations.
+        """
+        p, n = first, len(self._phases)
+        while p < n:
+            if self._schedule is None:
+                self._schedule = self._build_schedule()
+            sched = self._schedule
+            while p < n:
+                for fn, phase in sched[p]:
+                    fn(self, phase)
+                p += 1
+                if self._schedule is not sched:
+                    break
+
+    def compile_schedule(self) -> Callable[[Any, int], int]:
+        """Generate and cache a run loop with the current schedule unrolled into straight-line calls.
+
+        The returned ``_run(kernel, steps)`` executes up to `steps` ticks and returns
+        how many it ran; it stops after the tick in which the registry changes so
+        the caller can continue with a fresh schedule. Schedules longer than
+        _MAX_UNROLL entries keep a loop over the entries instead of unrolling.
+        """
+        if self._schedule is None:
+            self._schedule = self._build_schedule()
+        sched = self._schedule
+        namespace: Dict[str, Any] = {'__builtins__': {}, 'range': range, 'sched': sched}
+        lines = ['def _run(self, steps):',
+                 '    for i in range(steps):']
+        unroll = sum(len(entries) for entries in sched) <= _MAX_UNROLL
+        j = 0
+        for p, entries in enumerate(sched):
+            if not entries:
+                continue
+            if unroll:
+                for fn, phase in entries:
+                    namespace[f'f{j}'] = fn
+                    lines.append(f'        f{j}(self, {phase!r})')
+                    j += 1
+            else:
+                lines.append(f'        for fn, phase in sched[{p}]:')
+                lines.append('            fn(self, phase)')
+            if p + 1 < len(sched):
+                # the registry changed mid-tick: finish it with a fresh schedule
+                lines += ['        if self._compiled_run is not _run:',
+                          f'            self._run_phases({p + 1})',
+                          '            self.time += 1',
+                          '            return i + 1']
+        lines += ['        self.time += 1',
+                  '        if self._compiled_run is not _run:',
+                  '            return i + 1',
+                  '    return steps']
+        exec('\n'.join(lines), namespace)
+        self._compiled_run = namespace['_run']
+        return self._compiled_run
+
     def run(self, steps: int):
-        for _ in range(steps):
-            self.step()
+        """Run `steps` ticks, switching to a compiled loop (see compile_schedule)
+        once the registry has stayed unchanged for _COMPILE_AFTER ticks."""
+        while steps > 0:
+            if self._counter_plan is None:
+                self._counter_plan = self._build_counter_plan()
+            if self._counter_plan:
+                for _ in range(steps):
+                    self.step()
+                return
+            run = self._compiled_run
+            if run is None:
+                if self._stable_ticks < _COMPILE_AFTER:
+                    self._run_phases()
+                    self.time += 1
+                    self._stable_ticks += 1
+                    steps -= 1
+                    continue
+                run = self.compile_schedule()
+            steps -= run(self, steps)
 
     def snapshot(self) -> bytes:
-        """Return a bytes blob encoding kernel time and RNG manager state."""
-        state = {
-            'time': self.time,
-            'rng': self._rng_manager.get_state(),
-            'phases': self._phases,
-            # we do not serialize entities here; entities are expected to implement their own snapshot APIs
-        }
-        return pickle.dumps(state)
+        """Return a bytes blob encoding kernel time and RNG manager state.
+
+        Entities are not serialized here; they implement their own snapshot APIs.
+        """
+        return pack_rng_manager(self._rng_manager, self.time, self._phases)
 
     def restore(self, blob: bytes):
-        state = pickle.loads(blob)
+        if blob[:len(KERNEL_MAGIC)] != KERNEL_MAGIC:
+            # pickled blobs from the Mersenne Twister kernel carry states that have
+            # no SplitMix64 equivalent, so there is nothing to convert them to
+            raise ValueError("Not a binary kernel snapshot; pickled snapshots from before "
+                             "SplitMix64 streams cannot be restored")
+        state = unpack_rng_manager(blob)
         self.time = state['time']
         self._phases = state.get('phases', self._phases)
+        self._invalidate()
         self._rng_manager.set_state(state['rng'])
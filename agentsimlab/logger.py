@@ -1,16 +1,110 @@
-"""Lightweight simulation logger."""
+"""Lightweight simulation logger.
+
+Events are serialized to JSON with orjson when it is installed, otherwise
+with the stdlib json module using the same compact separators and UTF-8
+output. Events orjson refuses (integers beyond 64 bits, types json encodes
+differently) go through json, and the json path writes NaN and Infinity as
+null like orjson does, so both paths accept the same events and parse back
+to the same values; only float exponents are spelled differently (1e16 vs
+1e+16).
+"""
+import math
 import json
-from typing import Any, Dict
+import sys
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional accelerator
+    orjson = None
+
+_ORJSON_OPTS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson is not None else 0
+
+def _finite(obj: Any) -> Any:
+    """Copy of `obj` with non-finite floats (in containers too) replaced by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {_finite(k): _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+def _json_dumps(evt: Any) -> bytes:
+    try:
+        out = json.dumps(evt, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        # NaN/Infinity somewhere in the event: write null, as orjson does
+        out = json.dumps(_finite(evt), separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    return out.encode('utf-8')
+
+def _dumps(evt: Dict) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(evt, option=_ORJSON_OPTS)
+        except TypeError:  # orjson.JSONEncodeError: left to json, which may accept it
+            pass
+    return _json_dumps(evt)
 
 class SimLogger:
-    def __init__(self):
-        self._events = []
+    """Collects simulation events as JSON lines.
+
+    With no `path`, events are kept in memory as three parallel columns
+    (interned type and actor strings, payload dicts) until export_jsonl() or
+    to_arrow(). With a `path`, events are serialized and streamed to that file
+    through a large write buffer; call close() (or use the logger as a context
+    manager) to flush it.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self._types: List[str] = []
+        self._actors: List[str] = []
+        self._payloads: List[Dict] = []
+        self.path = path
+        self._fh = open(path, 'wb', buffering=1 << 20) if path is not None else None
 
     def log(self, event_type: str, actor: str, payload: Dict):
-        evt = {'type': event_type, 'actor': actor, 'payload': payload}
-        self._events.append(evt)
+        if self.path is not None:
+            self._fh.write(_dumps({'type': event_type, 'actor': actor, 'payload': payload}) + b'\n')
+            return
+        self._types.append(sys.intern(event_type))
+        self._actors.append(sys.intern(actor))
+        self._payloads.append(payload)
+
+    def _check_in_memory(self, what: str):
+        if self.path is not None:
+            raise RuntimeError(f"{what} is unavailable in streaming mode; events are already in the log file")
 
     def export_jsonl(self, path: str):
-        with open(path, 'w') as f:
-            for e in self._events:
-                f.write(json.dumps(e) + "\n")
+        self._check_in_memory('export_jsonl')
+        with open(path, 'wb') as f:
+            f.writelines(_dumps({'type': t, 'actor': a, 'payload': p}) + b'\n'
+                         for t, a, p in zip(self._types, self._actors, self._payloads))
+
+    def to_arrow(self):
+        """Return the events as a pyarrow.Table.
+
+        `type` and `actor` are dictionary-encoded; `payload` holds each payload
+        as a JSON string since payload schemas vary between event types.
+        """
+        self._check_in_memory('to_arrow')
+        try:
+            import pyarrow as pa
+        except ImportError as exc:
+            raise ImportError("SimLogger.to_arrow requires pyarrow (pip install agentsimlab[arrow])") from exc
+        return pa.table({
+            'type': pa.array(self._types, pa.string()).dictionary_encode(),
+            'actor': pa.array(self._actors, pa.string()).dictionary_encode(),
+            'payload': pa.array([_dumps(p).decode('utf-8') for p in self._payloads], pa.string()),
+        })
+
+    def close(self):
+        # the closed file stays in place so a later log() raises its ValueError
+        if self._fh is not None:
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
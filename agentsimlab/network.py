@@ -1,15 +1,48 @@
 """Network / communication layer stubs."""
-from typing import Dict, Any
+import struct
+from collections import deque
+from typing import Deque, Dict, Any, Iterator, Tuple
+
+# fixed-size envelope for numeric messages: src, dst (utf-8, NUL-padded/truncated to 16 bytes), payload id
+PACKED_RECORD = struct.Struct('<16s16sQ')
 
 class Network:
     def __init__(self, topology=None):
         self.topology = topology or {}
-        self.messages = []
+        self.messages: Deque[Dict[str, Any]] = deque()
+        # packed fast path: PACKED_RECORD envelopes appended back to back
+        self._buf = bytearray()
+        self._count = 0
 
     def send(self, src: str, dst: str, payload: Any):
         self.messages.append({'src': src, 'dst': dst, 'payload': payload})
 
-    def drain(self):
-        msgs = list(self.messages)
-        self.messages.clear()
+    def drain(self) -> Deque[Dict[str, Any]]:
+        """Return all pending messages in send order and start a fresh queue."""
+        msgs, self.messages = self.messages, deque()
         return msgs
+
+    def send_packed(self, src: str, dst: str, payload_id: int):
+        """Queue a numeric message as a 40-byte binary record instead of a dict.
+
+        `src` and `dst` must encode to at most 16 utf-8 bytes; longer ids raise
+        ValueError rather than being truncated (which could split a character
+        or make distinct ids collide).
+        """
+        s, d = src.encode('utf-8'), dst.encode('utf-8')
+        if len(s) > 16 or len(d) > 16:
+            raise ValueError(f"packed message ids must encode to at most 16 utf-8 bytes: {src!r} -> {dst!r}")
+        self._buf += PACKED_RECORD.pack(s, d, payload_id)
+        self._count += 1
+
+    def drain_packed(self) -> Tuple[memoryview, int]:
+        """Return (records, count) for pending packed messages and start a fresh buffer."""
+        buf, count = self._buf, self._count
+        self._buf, self._count = bytearray(), 0
+        return memoryview(buf), count
+
+    @staticmethod
+    def iter_packed(records: memoryview) -> Iterator[Tuple[str, str, int]]:
+        """Decode drain_packed() records into (src, dst, payload_id) tuples."""
+        for src, dst, payload_id in PACKED_RECORD.iter_unpack(records):
+            yield src.rstrip(b'\0').decode('utf-8'), dst.rstrip(b'\0').decode('utf-8'), payload_id
@@ -0,0 +1,51 @@
+"""Object pool for reusing agent instances across experiment runs."""
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+
+def _reinit(agent, *args, **kwargs):
+    type(agent).__init__(agent, *args, **kwargs)
+
+class AgentPool:
+    """A bounded free-list of agents built by `factory`.
+
+    acquire(*args, **kwargs) returns a released agent reset with the same
+    arguments (by default by re-running its __init__), or a new one from
+    factory(*args, **kwargs) when the pool is empty. Agents released while the
+    pool already holds `max_size` are dropped. Pass ``thread_safe=True`` to
+    guard the free-list with a lock.
+    """
+    def __init__(self, factory: Callable[..., Any], max_size: int = 1024,
+                 reset: Optional[Callable[..., None]] = None, thread_safe: bool = False):
+        self._factory = factory
+        self._reset = reset or _reinit
+        self.max_size = max_size
+        self._free = deque()
+        self._lock = threading.Lock() if thread_safe else None
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self, *args, **kwargs):
+        agent = self._pop()
+        if agent is None:
+            return self._factory(*args, **kwargs)
+        self._reset(agent, *args, **kwargs)
+        return agent
+
+    def release(self, agent):
+        if self._lock is None:
+            self._push(agent)
+        else:
+            with self._lock:
+                self._push(agent)
+
+    def _push(self, agent):
+        if len(self._free) < self.max_size:
+            self._free.append(agent)
+
+    def _pop(self):
+        if self._lock is None:
+            return self._free.pop() if self._free else None
+        with self._lock:
+            return self._free.pop() if self._free else None
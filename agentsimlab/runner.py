@@ -1,30 +1,69 @@
 """Experiment runner updated to use deterministic kernel registration."""
 from .kernel import Kernel
 from .snapshot import Snapshot
-from typing import Iterable
+from .pool import AgentPool
+from typing import Any, Dict, List, Optional
 
 class Experiment:
-    def __init__(self, seed=0, phases=None):
+    def __init__(self, seed=0, phases=None, pool: Optional[AgentPool] = None):
         self.kernel = Kernel(seed=seed, phases=phases)
-        self.agents = []
+        # id(agent) -> agent, in add order, so release_agent() needs no list scan
+        self._agents: Dict[int, Any] = {}
         self.logger = None
+        self.pool = pool
+
+    @property
+    def agents(self) -> List[Any]:
+        """The experiment's agents in the order they were added."""
+        return list(self._agents.values())
 
     def add_agent(self, agent, phase=None):
-        self.agents.append(agent)
+        self._agents[id(agent)] = agent
         # register with kernel under agent.agent_id
         self.kernel.register(agent.agent_id, agent, phase=phase)
+        bind = getattr(agent, 'bind_counter', None)
+        if bind is not None:
+            bind(self.kernel)
+
+    def spawn_agent(self, *args, phase=None, **kwargs):
+        """Acquire an agent from the pool (built with `args`/`kwargs`) and add it."""
+        if self.pool is None:
+            raise ValueError("spawn_agent requires an Experiment created with a pool")
+        agent = self.pool.acquire(*args, **kwargs)
+        self.add_agent(agent, phase=phase)
+        return agent
+
+    def release_agent(self, agent):
+        """Remove `agent` from the experiment and kernel and return it to the pool, if any."""
+        self.kernel.unregister(agent)
+        del self._agents[id(agent)]
+        self._recycle(agent)
+
+    def close(self):
+        """Release every agent, e.g. to recycle them into the next run via a shared pool."""
+        agents, self._agents = self._agents, {}
+        for a in agents.values():
+            self.kernel.unregister(a)
+            self._recycle(a)
+
+    def _recycle(self, agent):
+        unbind = getattr(agent, 'unbind_counter', None)
+        if unbind is not None:
+            unbind()
+        if self.pool is not None:
+            self.pool.release(agent)
 
     def run(self, steps=10):
-        for a in self.agents:
+        for a in self._agents.values():
             a.on_start(self.kernel)
         self.kernel.run(steps)
 
     def snapshot(self):
-        agent_states = {a.agent_id: a.snapshot() for a in self.agents}
+        agent_states = {a.agent_id: a.snapshot() for a in self._agents.values()}
         return Snapshot(self.kernel.snapshot(), agent_states)
 
     def restore(self, snapshot_obj: Snapshot):
         self.kernel.restore(snapshot_obj.kernel_blob)
-        for a in self.agents:
+        for a in self._agents.values():
             state = snapshot_obj.agent_states.get(a.agent_id, {})
             a.restore(state)
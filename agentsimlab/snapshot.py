@@ -1,18 +1,119 @@
 """Snapshot utilities coordinating kernel and agent snapshots."""
+import io
 import pickle
-from typing import Any, Dict, Iterable
+import struct
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Binary kernel blob layout (all little-endian):
+#   header   <4sHQQIII magic, version, time, master seed, n_phases, n_streams, n_seeds
+#   phases   n_phases x u32 lengths, then the utf-8 names concatenated
+#   names    n_streams x u32 lengths, then the utf-8 names concatenated
+#   states   n_streams x u64 stream states, in stream index order
+#   cold     n_seeds names (as above), then n_seeds x u64 seeds of reserved,
+#            not yet materialized streams
+KERNEL_MAGIC = b'ASLK'
+KERNEL_FORMAT_VERSION = 4
+_HEADER = struct.Struct('<4sHQQIII')
+
+SNAPSHOT_MAGIC = b'ASLS'
+_FILE_HEADER = struct.Struct('<4sI')
+_BUFFER_LEN = struct.Struct('<Q')
+
+def _pack_strings(strings: List[str]) -> bytes:
+    encoded = [s.encode('utf-8') for s in strings]
+    lengths = np.array([len(b) for b in encoded], dtype='<u4')
+    return lengths.tobytes() + b''.join(encoded)
+
+def _unpack_strings(buf: memoryview, offset: int, count: int) -> Tuple[List[str], int]:
+    lengths = np.frombuffer(buf, dtype='<u4', count=count, offset=offset).tolist()
+    offset += 4 * count
+    out = []
+    for n in lengths:
+        out.append(bytes(buf[offset:offset + n]).decode('utf-8'))
+        offset += n
+    return out, offset
+
+def pack_rng_manager(mgr, time: int, phases: List[str]) -> bytes:
+    """Serialize kernel time, phases and RNG manager state into the fixed binary layout."""
+    mgr.sync()
+    names = list(mgr._index)
+    cold = mgr._seeds
+    parts = [
+        _HEADER.pack(KERNEL_MAGIC, KERNEL_FORMAT_VERSION, time, mgr.master_seed,
+                     len(phases), len(names), len(cold)),
+        _pack_strings(phases),
+        _pack_strings(names),
+        mgr.states[:len(names)].astype('<u8', copy=False).tobytes(),
+        _pack_strings(list(cold)),
+        np.fromiter(cold.values(), dtype='<u8', count=len(cold)).tobytes(),
+    ]
+    return b''.join(parts)
+
+def unpack_rng_manager(blob: bytes) -> Dict[str, Any]:
+    """Inverse of pack_rng_manager; returns time, phases and an RNGManager.set_state() dict."""
+    buf = memoryview(blob)
+    magic, version, time, master_seed, n_phases, n_streams, n_seeds = _HEADER.unpack_from(buf, 0)
+    if magic != KERNEL_MAGIC or version != KERNEL_FORMAT_VERSION:
+        raise ValueError(f"Unsupported kernel snapshot format: {magic!r} v{version}")
+    phases, offset = _unpack_strings(buf, _HEADER.size, n_phases)
+    names, offset = _unpack_strings(buf, offset, n_streams)
+    states = np.frombuffer(buf, dtype='<u8', count=n_streams, offset=offset).astype(np.uint64)
+    offset += 8 * n_streams
+    cold_names, offset = _unpack_strings(buf, offset, n_seeds)
+    seeds = np.frombuffer(buf, dtype='<u8', count=n_seeds, offset=offset).tolist()
+    return {
+        'time': time,
+        'phases': phases,
+        'rng': {
+            'master_seed': master_seed,
+            'names': names,
+            'states': states,
+            'seeds': dict(zip(cold_names, seeds)),
+        },
+    }
 
 class Snapshot:
+    __slots__ = ('kernel_blob', 'agent_states')
+
     def __init__(self, kernel_blob: bytes, agent_states: Dict[str, Dict]):
         self.kernel_blob = kernel_blob
         self.agent_states = agent_states
 
     def save(self, path: str):
+        """Write the snapshot to `path`.
+
+        Layout: <4sI magic and out-of-band buffer count, then each buffer as a
+        <Q length plus its bytes, then a protocol-5 pickle that refers to them.
+        The kernel blob travels out-of-band so it is written without being
+        copied into the pickle stream.
+        """
+        buffers = []
+        stream = io.BytesIO()
+        pickle.Pickler(stream, protocol=5, buffer_callback=buffers.append).dump(
+            {'kernel': pickle.PickleBuffer(self.kernel_blob), 'agents': self.agent_states})
         with open(path, 'wb') as f:
-            pickle.dump({'kernel': self.kernel_blob, 'agents': self.agent_states}, f)
+            f.write(_FILE_HEADER.pack(SNAPSHOT_MAGIC, len(buffers)))
+            for b in buffers:
+                raw = b.raw()
+                f.write(_BUFFER_LEN.pack(raw.nbytes))
+                f.write(raw)
+            f.write(stream.getbuffer())
 
     @staticmethod
     def load(path: str):
         with open(path, 'rb') as f:
-            data = pickle.load(f)
+            header = f.read(_FILE_HEADER.size)
+            if header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                # legacy plain-pickle snapshot file
+                f.seek(0)
+                data = pickle.load(f)
+            else:
+                _magic, count = _FILE_HEADER.unpack(header)
+                buffers = []
+                for _ in range(count):
+                    (n,) = _BUFFER_LEN.unpack(f.read(_BUFFER_LEN.size))
+                    buffers.append(f.read(n))
+                data = pickle.Unpickler(f, buffers=buffers).load()
         return Snapshot(data['kernel'], data['agents'])
@@ -3,4 +3,6 @@ setup(
     name="agentsimlab",
     version="0.0.0",
     packages=find_packages(),
+    install_requires=["numpy"],
+    extras_require={"fast": ["numba", "orjson"], "arrow": ["pyarrow"]},
 )
@@ -1,3 +1,5 @@
+import pytest
+
 from agentsimlab.kernel import Kernel
 from agentsimlab.agent import CounterAgent
 from agentsimlab.snapshot import Snapshot
@@ -44,3 +46,447 @@ def test_snapshot_and_restore_multi_agent(tmp_path):
     kernel.run(2)
     for a, v in zip(agents, vals_after):
         assert abs(a.counter - v) < 1e-12
+
+class _GenericCounter(CounterAgent):
+    # overriding step_phase opts out of both batched paths
+    def step_phase(self, kernel, phase):
+        self.step(kernel)
+
+def test_counter_fast_path_matches_generic_loop():
+    fast = Kernel(seed=7)
+    slow = Kernel(seed=7)
+    fast_agents = [CounterAgent(f'a{i}') for i in range(4)]
+    slow_agents = [_GenericCounter(f'a{i}') for i in range(4)]
+    for a, b in zip(fast_agents, slow_agents):
+        fast.register(a.agent_id, a)
+        slow.register(b.agent_id, b)
+    fast.run(6)
+    slow.run(6)
+    assert fast._counter_plan and not slow._counter_plan
+    assert [a.counter for a in fast_agents] == [b.counter for b in slow_agents]
+
+def test_splitmix_python_fallback_matches_compiled():
+    import numpy as np
+    from agentsimlab import _rng_nb
+    seeds = np.array([1, 2**63 - 1, 12345], dtype=np.uint64)
+    idx = np.arange(3, dtype=np.int64)
+    s1, s2 = seeds.copy(), seeds.copy()
+    c1, c2 = np.zeros(3), np.zeros(3)
+    for _ in range(5):
+        _rng_nb.step_counters(s1, idx, c1)
+        _rng_nb._step_counters_py(s2, idx, c2)
+    assert (s1 == s2).all()
+    assert (c1 == c2).all()
+
+def test_register_many_matches_sequential_stream_creation():
+    bulk = Kernel(seed=11)
+    seq = Kernel(seed=11)
+    bulk_agents = [CounterAgent(f'a{i}') for i in range(5)]
+    seq_agents = [CounterAgent(f'a{i}') for i in range(5)]
+    bulk.register_many((a.agent_id, a) for a in bulk_agents)
+    for a in seq_agents:
+        seq.register(a.agent_id, a)
+    bulk.run(3)
+    seq.run(3)
+    assert [a.counter for a in bulk_agents] == [a.counter for a in seq_agents]
+
+def test_schedule_runs_phases_before_registration_order():
+    calls = []
+
+    class Recorder:
+        def __init__(self, name):
+            self.name = name
+
+        def step_phase(self, kernel, phase):
+            calls.append((self.name, phase))
+
+    class PlainStepper:
+        def step(self, kernel):
+            calls.append(('plain', None))
+
+    kernel = Kernel(seed=0)
+    kernel.register('late', Recorder('late'), phase='commit')
+    kernel.register('early', Recorder('early'), phase='perceive')
+    kernel.register('plain', PlainStepper(), phase='act')
+    kernel.step()
+    assert calls == [('early', 'perceive'), ('plain', None), ('late', 'commit')]
+
+def test_restore_rejects_pickled_mersenne_twister_blobs():
+    import pickle
+    import random
+    import pytest
+    kernel = Kernel(seed=5)
+    agents = [CounterAgent(f'a{i}') for i in range(3)]
+    for a in agents:
+        kernel.register(a.agent_id, a)
+    kernel.run(2)
+    blob = kernel.snapshot()
+    # the blob layout written by the pickle-based kernel (random.Random states)
+    legacy = pickle.dumps({'time': 2, 'phases': kernel._phases,
+                           'rng': {'master_state': random.Random(5).getstate(),
+                                   'streams': {'a0': random.Random(1).getstate()}}})
+    expected = kernel.get_rng('a0').random()
+    with pytest.raises(ValueError, match='cannot be restored'):
+        kernel.restore(legacy)
+    kernel.restore(blob)
+    assert kernel.time == 2
+    assert kernel.get_rng('a0').random() == expected
+
+def test_batch_act_group_matches_generic_loop():
+    class Observer:
+        def step(self, kernel):
+            pass
+
+    fast = Kernel(seed=3)
+    slow = Kernel(seed=3)
+    fast_agents = [CounterAgent(f'a{i}') for i in range(4)]
+    slow_agents = [_GenericCounter(f'a{i}') for i in range(4)]
+    for a, b in zip(fast_agents, slow_agents):
+        fast.register(a.agent_id, a, phase='act')
+        slow.register(b.agent_id, b, phase='act')
+    # a non-counter entity disables the all-CounterAgent plan and splits the run
+    fast.register('obs', Observer(), phase='perceive')
+    slow.register('obs', Observer(), phase='perceive')
+    fast.run(4)
+    slow.run(4)
+    assert not fast._counter_plan
+    assert [a.counter for a in fast_agents] == [b.counter for b in slow_agents]
+    assert fast.batch_random(['a0', 'a1']).tolist() == [slow.get_rng('a0').random(), slow.get_rng('a1').random()]
+
+def test_unregister_keeps_registration_order_across_compaction():
+    kernel = Kernel(seed=0)
+    agents = [CounterAgent(f'a{i}') for i in range(40)]
+    for a in agents:
+        kernel.register(a.agent_id, a)
+    kernel.register(agents[0].agent_id, agents[0])  # duplicate is ignored
+    for a in agents[:30:2] + agents[1:25:2]:
+        kernel.unregister(a)
+    remaining = [a for a in agents if a not in agents[:30:2] + agents[1:25:2]]
+    assert [e for _p, e in kernel._ordered_entities()] == remaining
+    kernel.register(agents[0].agent_id, agents[0])
+    assert [e for _p, e in kernel._ordered_entities()] == remaining + [agents[0]]
+
+def test_homogeneous_block_matches_agent_objects():
+    import numpy as np
+    block_kernel = Kernel(seed=21)
+    obj_kernel = Kernel(seed=21)
+    ids = [f'a{i}' for i in range(6)]
+    states = block_kernel.register_homogeneous(
+        CounterAgent, {'ids': ids, 'counter': np.zeros(len(ids))})
+    agents = [CounterAgent(i) for i in ids]
+    for a in agents:
+        obj_kernel.register(a.agent_id, a)
+    block_kernel.run(5)
+    obj_kernel.run(5)
+    assert block_kernel.time == 5
+    assert states['counter'].tolist() == [a.counter for a in agents]
+
+def test_snapshot_load_reads_legacy_pickle_files(tmp_path):
+    import pickle
+    p = tmp_path / 'legacy.snap'
+    p.write_bytes(pickle.dumps({'kernel': b'blob', 'agents': {'a0': {'counter': 1.5}}}))
+    loaded = Snapshot.load(str(p))
+    assert bytes(loaded.kernel_blob) == b'blob'
+    assert loaded.agent_states == {'a0': {'counter': 1.5}}
+
+def test_compiled_run_picks_up_registry_changes_mid_run():
+    ticks = {}
+
+    class Ticker:
+        def __init__(self, name, spawn_at=None):
+            self.name = name
+            self.spawn_at = spawn_at
+
+        def step(self, kernel):
+            ticks[self.name] = ticks.get(self.name, 0) + 1
+            if kernel.time == self.spawn_at:
+                kernel.register('late', Ticker('late'))
+
+    kernel = Kernel(seed=0)
+    kernel.register('early', Ticker('early', spawn_at=2))
+    kernel.run(5)
+    assert kernel.time == 5
+    assert ticks == {'early': 5, 'late': 2}
+
+def test_run_matches_step_for_long_schedules():
+    stepped = Kernel(seed=4)
+    ran = Kernel(seed=4)
+    stepped_agents = [_GenericCounter(f'a{i}') for i in range(300)]
+    ran_agents = [_GenericCounter(f'a{i}') for i in range(300)]
+    for a, b in zip(stepped_agents, ran_agents):
+        stepped.register(a.agent_id, a)
+        ran.register(b.agent_id, b)
+    for _ in range(3):
+        stepped.step()
+    ran.run(3)
+    assert [a.counter for a in stepped_agents] == [b.counter for b in ran_agents]
+
+def test_stream_handles_survive_state_array_growth():
+    grown = Kernel(seed=8)
+    plain = Kernel(seed=8)
+    early = grown.get_rng('first')
+    expected = plain.get_rng('first')
+    early.random()
+    expected.random()
+    for i in range(100):
+        grown.get_rng(f'n{i}')
+    assert early.random() == expected.random()
+    assert early.get_state() == grown.get_rng('first').get_state()
+
+def test_stream_seeds_depend_only_on_master_seed_and_name():
+    forward = Kernel(seed=13)
+    backward = Kernel(seed=13)
+    names = [f'a{i}' for i in range(5)]
+    for n in names:
+        forward.get_rng(n)
+    for n in reversed(names):
+        backward.get_rng(n)
+    assert [forward.get_rng(n).get_state() for n in names] == \
+        [backward.get_rng(n).get_state() for n in names]
+    assert Kernel(seed=14).get_rng('a0').get_state() != forward.get_rng('a0').get_state()
+
+def test_reserved_streams_stay_cold_until_first_use():
+    kernel = Kernel(seed=17)
+    agents = [CounterAgent(f'a{i}') for i in range(3)]
+    kernel.register_many((a.agent_id, a) for a in agents)
+    mgr = kernel._rng_manager
+    assert set(mgr._seeds) == {'a0', 'a1', 'a2'} and not mgr._index
+    blob = kernel.snapshot()
+    first = kernel.get_rng('a1').random()
+    assert 'a1' in mgr._index and 'a1' not in mgr._seeds
+    kernel.restore(blob)
+    # a1 was cold in the snapshot, so restoring rewinds it to its seed
+    assert kernel.get_rng('a1').random() == first
+    assert kernel.get_rng('a1').random() != first
+
+def test_buffered_scalar_draws_interleave_with_batch_kernels_and_snapshots():
+    from agentsimlab import _rng_nb
+    kernel = Kernel(seed=21)
+    rng = kernel.get_rng('x')
+    state = rng.get_state()
+
+    def expect(n):
+        nonlocal state
+        out = []
+        for _ in range(n):
+            state, r = _rng_nb._random_f64_py(state)
+            out.append(r)
+        return out
+
+    got = [rng.random() for _ in range(3)]
+    got += kernel.batch_random(['x']).tolist()
+    got += [rng.random() for _ in range(40)]
+    blob = kernel.snapshot()
+    tail = [rng.random() for _ in range(5)]
+    assert got == expect(44)
+    assert tail == expect(5)
+    kernel.restore(blob)
+    assert [rng.random() for _ in range(5)] == tail
+
+@pytest.mark.perf
+def test_scalar_draw_cost_stays_near_mersenne_twister():
+    # guards the per-draw fast path; compared against random.Random in the
+    # same process so the bound does not depend on machine speed
+    import random
+    import timeit
+    draw = Kernel(seed=22).get_rng('a').random
+    reference = random.Random(22).random
+    n = 20000
+    cost = min(timeit.repeat(draw, number=n, repeat=5))
+    base = min(timeit.repeat(reference, number=n, repeat=5))
+    assert cost < 5 * base
+
+def _registry_change_kernel(calls, change):
+    class Actor:
+        def __init__(self, name):
+            self.name = name
+
+        def step_phase(self, kernel, phase):
+            calls.append(self.name)
+            if self.name == 'killer':
+                change(kernel)
+
+    kernel = Kernel(seed=0)
+    kernel.register('killer', Actor('killer'), phase='perceive')
+    return kernel, Actor
+
+def test_entity_unregistered_mid_tick_skips_later_phases():
+    for advance in (Kernel.step, lambda k: k.run(1)):
+        calls = []
+        victim = []
+        kernel, Actor = _registry_change_kernel(calls, lambda k: k.unregister(victim[0]))
+        victim.append(Actor('victim'))
+        kernel.register('victim', victim[0], phase='act')
+        advance(kernel)
+        assert calls == ['killer']
+
+def test_entity_registered_mid_tick_runs_in_later_phases():
+    for advance in (Kernel.step, lambda k: k.run(1)):
+        calls = []
+        kernel, Actor = _registry_change_kernel(
+            calls, lambda k: k.register('late', Actor('late'), phase='commit'))
+        advance(kernel)
+        assert calls == ['killer', 'late']
+
+def test_master_seed_is_reduced_to_64_bits():
+    draw = lambda seed: Kernel(seed=seed).get_rng('a').random()
+    assert draw(-1) == draw(2**64 - 1) != draw(0)
+    assert draw(2**64) == draw(0)
+    with pytest.raises(TypeError, match='master seed'):
+        Kernel(seed=1.5)
+
+def test_subclass_overriding_act_is_not_batched():
+    class Noisy(CounterAgent):
+        def act(self, kernel):
+            self.counter += 100
+
+    class Observer:
+        def step(self, kernel):
+            pass
+
+    kernel = Kernel(seed=4)
+    noisy = Noisy('n')
+    plain = CounterAgent('p')
+    kernel.register('obs', Observer())
+    kernel.register(noisy.agent_id, noisy, phase='act')
+    kernel.register(plain.agent_id, plain, phase='act')
+    kernel.run(3)
+    assert noisy.counter == 300
+    assert 0 < plain.counter < 3
+
+def test_restore_carries_the_master_seed_for_later_streams():
+    original = Kernel(seed=31)
+    original.get_rng('a').random()
+    blob = original.snapshot()
+    restored = Kernel(seed=0)
+    restored.restore(blob)
+    assert restored.get_rng('b').get_state() == original.get_rng('b').get_state()
+
+def test_streams_and_kernels_survive_pickle_and_deepcopy():
+    import copy
+    import pickle
+    kernel = Kernel(seed=23)
+    agents = [CounterAgent(f'a{i}') for i in range(2)]
+    for a in agents:
+        kernel.register(a.agent_id, a)
+    kernel.run(2)
+    rng = kernel.get_rng('x')
+    rng.random()
+    before = kernel.get_rng('a0').get_state()
+    for clone in (copy.deepcopy, lambda obj: pickle.loads(pickle.dumps(obj))):
+        stream = clone(rng)
+        twin = clone(kernel)
+        expected = [stream.random() for _ in range(20)]
+        assert [twin.get_rng('x').random() for _ in range(20)] == expected
+        twin.run(3)
+        assert twin.time == 5 and twin.get_rng('a0').get_state() != before
+    assert kernel.get_rng('a0').get_state() == before
+    assert [rng.random() for _ in range(20)] == expected
+
+def test_randint_is_unbiased_over_wide_ranges():
+    rng = Kernel(seed=24).get_rng('r')
+    with pytest.raises(ValueError):
+        rng.randint(5, 3)
+    assert rng.randint(7, 7) == 7
+    assert {rng.randint(1, 3) for _ in range(200)} == {1, 2, 3}
+    wide = [rng.randint(0, 2**60) for _ in range(64)]
+    assert all(0 <= v <= 2**60 for v in wide)
+    assert any(v % 128 for v in wide)
+    huge = rng.randint(-2**100, 2**100)
+    assert -2**100 <= huge <= 2**100
+
+def test_counter_agents_copy_unbound_and_follow_rebinding():
+    import copy
+    import pickle
+    kernel = Kernel(seed=25)
+    agent = CounterAgent('a')
+    kernel.register(agent.agent_id, agent)
+    kernel.run(2)
+    value = agent.counter
+    for clone in (copy.deepcopy(agent), pickle.loads(pickle.dumps(agent))):
+        assert clone._kernel is None and clone.counter == value
+    # stepping the same agent from a second kernel must not strand either
+    # kernel's increments in a freed slot
+    other = Kernel(seed=26)
+    other.register(agent.agent_id, agent)
+    kernel.step()
+    other.step()
+    kernel.step()
+    mine = Kernel(seed=25).get_rng('a')
+    theirs = Kernel(seed=26).get_rng('a')
+    first, second, third, fourth = (mine.random() for _ in range(4))
+    assert value == first + second
+    assert agent.counter == value + third + theirs.random() + fourth
+
+def test_incremental_schedule_matches_rebuilt_schedule():
+    import random
+
+    class Observer:
+        def step(self, kernel):
+            pass
+
+    def flat(kernel):
+        out = []
+        for entries in kernel._schedule:
+            for fn, phase in entries:
+                # bound step_phase / group.run, or the default-step lambda
+                owner = getattr(fn, '__self__', None) or fn.__defaults__[0]
+                out += [(phase, id(e)) for e in getattr(owner, 'entities', [owner])]
+        return out
+
+    pick = random.Random(27)
+    kernel = Kernel(seed=27)
+    live = []
+    kernel.step()
+    for i in range(200):
+        if live and pick.random() < 0.4:
+            kernel.unregister(live.pop(pick.randrange(len(live))))
+        else:
+            entity = pick.choice([CounterAgent, _GenericCounter, lambda _id: Observer()])(f'e{i}')
+            kernel.register(f'e{i}', entity, phase=pick.choice(kernel._phases))
+            live.append(entity)
+        incremental = flat(kernel)
+        kernel._schedule = kernel._build_schedule()
+        assert incremental == flat(kernel)
+
+def test_run_does_not_recompile_under_registry_churn():
+    compiles = []
+
+    class Plain:
+        def step(self, kernel):
+            pass
+
+    class Churner:
+        def __init__(self):
+            self.prev = None
+
+        def step(self, kernel):
+            fresh = Plain()
+            kernel.register(f't{kernel.time}', fresh)
+            if self.prev is not None:
+                kernel.unregister(self.prev)
+            self.prev = fresh
+
+    def counted(kernel):
+        compile_schedule = kernel.compile_schedule
+
+        def wrapper():
+            compiles.append(kernel.time)
+            return compile_schedule()
+        kernel.compile_schedule = wrapper
+        return kernel
+
+    stable = counted(Kernel(seed=0))
+    for i in range(20):
+        stable.register(f'p{i}', Plain())
+    stable.run(100)
+    assert len(compiles) == 1
+
+    del compiles[:]
+    churned = counted(Kernel(seed=0))
+    for i in range(20):
+        churned.register(f'p{i}', Plain())
+    churned.register('c', Churner())
+    churned.run(100)
+    assert churned.time == 100 and compiles == []
+    assert len(churned._schedule[0]) == 22
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from agentsimlab.logger import SimLogger
+
+def test_export_and_streaming_write_same_lines(tmp_path):
+    mem = SimLogger()
+    with SimLogger(str(tmp_path / 'stream.jsonl')) as streamed:
+        for i in range(3):
+            for logger in (mem, streamed):
+                logger.log('move', f'a{i}', {'step': i, 'pos': [i, i + 1]})
+    mem.export_jsonl(str(tmp_path / 'mem.jsonl'))
+    mem_lines = (tmp_path / 'mem.jsonl').read_text().splitlines()
+    assert mem_lines == (tmp_path / 'stream.jsonl').read_text().splitlines()
+    assert json.loads(mem_lines[2]) == {'type': 'move', 'actor': 'a2', 'payload': {'step': 2, 'pos': [2, 3]}}
+
+def test_to_arrow_dictionary_encodes_type_and_actor():
+    pa = pytest.importorskip('pyarrow')
+    logger = SimLogger()
+    logger.log('move', 'a0', {'step': 0})
+    logger.log('move', 'a1', {'step': 1})
+    table = logger.to_arrow()
+    assert pa.types.is_dictionary(table.schema.field('type').type)
+    assert table.column('actor').to_pylist() == ['a0', 'a1']
+    assert [json.loads(p) for p in table.column('payload').to_pylist()] == [{'step': 0}, {'step': 1}]
+
+def test_dumps_matches_the_json_fallback():
+    import numpy as np
+    from agentsimlab import logger as logger_mod
+    events = ({'x': float('nan'), 'y': None, 'z': [float('-inf')]}, {'big': 2**70},
+              {'actor': 'nullbot', 's': 'é'}, {'v': np.float64(0.5)}, {1: (2, 3)})
+    for evt in events:
+        assert logger_mod._dumps(evt) == logger_mod._json_dumps(evt)
+    assert json.loads(logger_mod._dumps(events[0])) == {'x': None, 'y': None, 'z': [None]}
+    for dumps in (logger_mod._dumps, logger_mod._json_dumps):
+        with pytest.raises(TypeError):
+            dumps({'a': np.arange(3)})
+
+def test_log_after_close_raises_value_error(tmp_path):
+    logger = SimLogger(str(tmp_path / 'stream.jsonl'))
+    logger.log('move', 'a0', {})
+    logger.close()
+    logger.close()
+    with pytest.raises(ValueError):
+        logger.log('move', 'a0', {})
@@ -0,0 +1,24 @@
+import pytest
+
+from agentsimlab.network import Network
+
+def test_packed_messages_round_trip_in_send_order():
+    net = Network()
+    net.send_packed('a0', 'a1', 7)
+    net.send_packed('a1', 'a0', 2**40)
+    net.send('a0', 'a1', {'text': 'hi'})
+    records, count = net.drain_packed()
+    assert count == 2
+    assert list(Network.iter_packed(records)) == [('a0', 'a1', 7), ('a1', 'a0', 2**40)]
+    assert net.drain_packed()[1] == 0
+    assert list(net.drain()) == [{'src': 'a0', 'dst': 'a1', 'payload': {'text': 'hi'}}]
+
+def test_send_packed_rejects_ids_longer_than_16_bytes():
+    net = Network()
+    net.send_packed('é' * 8, 'b' * 16, 1)
+    for src, dst in (('a' + 'é' * 8, 'b'), ('a', 'b' * 17)):
+        with pytest.raises(ValueError):
+            net.send_packed(src, dst, 1)
+    records, count = net.drain_packed()
+    assert count == 1
+    assert list(Network.iter_packed(records)) == [('é' * 8, 'b' * 16, 1)]
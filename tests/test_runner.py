@@ -8,3 +8,42 @@ def test_experiment_basic():
     exp.run(steps=5)
     assert exp.kernel.time == 5
     assert a.counter > 0
+
+def test_release_agent_unregisters_and_frees():
+    exp = Experiment(seed=1)
+    keep, drop = CounterAgent('keep'), CounterAgent('drop')
+    exp.add_agent(keep)
+    exp.add_agent(drop)
+    exp.release_agent(drop)
+    exp.run(steps=3)
+    assert exp.agents == [keep]
+    assert keep.counter > 0 and drop.counter == 0.0
+
+def test_pool_recycles_agents_between_experiments():
+    from agentsimlab.pool import AgentPool
+    pool = AgentPool(CounterAgent, max_size=4)
+    first = Experiment(seed=42, pool=pool)
+    bot = first.spawn_agent('bot')
+    first.run(steps=5)
+    first.close()
+    assert len(pool) == 1 and first.agents == []
+
+    second = Experiment(seed=42, pool=pool)
+    again = second.spawn_agent('bot2')
+    assert again is bot
+    assert again.agent_id == 'bot2' and again.counter == 0.0
+    second.run(steps=5)
+    assert again.counter > 0
+
+def test_counters_live_in_kernel_array():
+    exp = Experiment(seed=3)
+    agents = [CounterAgent(f'a{i}') for i in range(3)]
+    for a in agents:
+        exp.add_agent(a)
+    exp.run(steps=4)
+    counters = exp.kernel.flush_counters()
+    assert counters.tolist() == [a.counter for a in agents]
+    value = agents[1].counter
+    exp.release_agent(agents[1])
+    assert agents[1].counter == value
+    assert exp.kernel.flush_counters()[agents[0]._idx] == agents[0].counter